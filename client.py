@@ -1,5 +1,7 @@
 import asyncio
+import random
 import httpx
+import orjson
 import time
 from typing import Optional, Dict, Any
 import logging
@@ -16,142 +18,226 @@ class WebAgentClient:
         self.base_url = base_url
         self.timeout = httpx.Timeout(connect=10.0, read=300.0, write=10.0, pool=10.0)
         self.session_id: Optional[str] = None
+        # Shared client so keep-alive (or HTTP/2) connections are reused across calls
+        self._client = httpx.AsyncClient(
+            http2=True,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=15.0)
+        )
 
     async def create_session(self, timeout_minutes: int = 30) -> str:
         """Create a new browser session"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/sessions",
-                    params={"timeout_minutes": timeout_minutes}
-                )
-                response.raise_for_status()
-
-                session_data = response.json()
-                self.session_id = session_data["session_id"]
-                logger.info(f"Created session: {self.session_id}")
-                return self.session_id
-
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Failed to create session: {e.response.status_code} - {e.response.text}")
-                raise
-            except Exception as e:
-                logger.error(f"Error creating session: {e}")
-                raise
+        try:
+            response = await self._client.post(
+                "/sessions",
+                params={"timeout_minutes": timeout_minutes}
+            )
+            response.raise_for_status()
+
+            session_data = orjson.loads(response.content)
+            self.session_id = session_data["session_id"]
+            logger.info(f"Created session: {self.session_id}")
+            return self.session_id
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Failed to create session: {e.response.status_code} - {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Error creating session: {e}")
+            raise
 
     async def get_session_info(self) -> Dict[str, Any]:
         """Get current session information"""
+        response = await self._get_session_response()
+        return orjson.loads(response.content)
+
+    async def _get_session_response(self) -> httpx.Response:
+        """Fetch the raw session response (keeps headers such as Retry-After)"""
         if not self.session_id:
             raise ValueError("No active session")
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.get(f"{self.base_url}/sessions/{self.session_id}")
-                response.raise_for_status()
-                return response.json()
+        try:
+            response = await self._client.get(f"/sessions/{self.session_id}")
+            response.raise_for_status()
+            return response
 
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    logger.warning("Session not found or expired")
-                    self.session_id = None
-                raise
-            except Exception as e:
-                logger.error(f"Error getting session info: {e}")
-                raise
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                logger.warning("Session not found or expired")
+                self.session_id = None
+            raise
+        except Exception as e:
+            logger.error(f"Error getting session info: {e}")
+            raise
+
+    async def query_async(
+            self,
+            question: str,
+            max_steps: int = 150,
+            poll_interval: float = 2,
+            max_interval: float = 30.0
+    ) -> Optional[str]:
+        """Execute a query asynchronously with polling (exponential backoff with full jitter)"""
+        if not self.session_id:
+            raise ValueError("No active session")
+
+        try:
+            # Start the query
+            query_data = {
+                "question": question,
+                "max_steps": max_steps
+            }
+
+            response = await self._client.post(
+                f"/sessions/{self.session_id}/query",
+                json=query_data
+            )
+            response.raise_for_status()
+
+            result = orjson.loads(response.content)
+            logger.info(f"Query started: {result['status']}")
+
+            # Poll for completion
+            start_time = time.time()
+            interval = poll_interval
+            prev_step = None
+            while True:
+                session_info_response = await self._get_session_response()
+                session_info = orjson.loads(session_info_response.content)
+                status = session_info['status']
+
+                # Back off while the agent is stuck on the same step, reset on progress
+                current_step = session_info.get('current_step')
+                if current_step != prev_step:
+                    interval = poll_interval
+                    prev_step = current_step
+                else:
+                    interval = min(max_interval, interval * 1.5)
+
+                # Log progress if available
+                if 'current_step' in session_info and session_info['current_step']:
+                    logger.info(
+                        f"Step {session_info['current_step']}: {session_info.get('current_action', 'Processing...')}")
+
+                if status == 'completed':
+                    answer = session_info.get('result')
+                    elapsed = time.time() - start_time
+                    logger.info(f"Query completed in {elapsed:.2f}s")
+                    return answer
+
+                elif status == 'error':
+                    error = session_info.get('error', 'Unknown error')
+                    logger.error(f"Query failed: {error}")
+                    raise Exception(f"Query failed: {error}")
+
+                elif status == 'cancelled':
+                    logger.warning("Query cancelled")
+                    raise Exception("Query cancelled")
+
+                elif status == 'processing':
+                    logger.info(f"Status: {status}")
+
+                # Wait before polling again, never sooner than the server's estimate
+                delay = random.uniform(0, interval)
+                retry_after = session_info_response.headers.get("Retry-After")
+                if retry_after is not None and retry_after.isdigit():
+                    delay = max(int(retry_after), delay)
+                await asyncio.sleep(delay)
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error during async query: {e.response.status_code} - {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Error during async query: {e}")
+            raise
 
-    async def query_async(self, question: str, max_steps: int = 150, poll_interval: int = 2) -> Optional[str]:
-        """Execute a query asynchronously with polling"""
+    async def query_stream(self, question: str, max_steps: int = 150) -> Optional[str]:
+        """Execute a query and follow its progress over Server-Sent Events"""
         if not self.session_id:
             raise ValueError("No active session")
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                # Start the query
-                query_data = {
-                    "question": question,
-                    "max_steps": max_steps
-                }
-
-                response = await client.post(
-                    f"{self.base_url}/sessions/{self.session_id}/query",
-                    json=query_data
-                )
+        try:
+            query_data = {
+                "question": question,
+                "max_steps": max_steps
+            }
+
+            start_time = time.time()
+            async with self._client.stream(
+                "POST",
+                f"/sessions/{self.session_id}/query/stream",
+                json=query_data
+            ) as response:
+                if response.is_error:
+                    await response.aread()
                 response.raise_for_status()
 
-                result = response.json()
-                logger.info(f"Query started: {result['status']}")
-
-                # Poll for completion
-                start_time = time.time()
-                while True:
-                    session_info = await self.get_session_info()
-                    status = session_info['status']
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = orjson.loads(line[len("data: "):])
 
-                    # Log progress if available
-                    if 'current_step' in session_info and session_info['current_step']:
-                        logger.info(
-                            f"Step {session_info['current_step']}: {session_info.get('current_action', 'Processing...')}")
+                    if "step" in event:
+                        logger.info(f"Step {event['step']}: {event['action']}")
 
-                    if status == 'completed':
-                        answer = session_info.get('result')
+                    elif event["status"] == 'completed':
                         elapsed = time.time() - start_time
                         logger.info(f"Query completed in {elapsed:.2f}s")
-                        return answer
+                        return event.get('answer')
 
-                    elif status == 'error':
-                        error = session_info.get('error', 'Unknown error')
+                    elif event["status"] == 'error':
+                        error = event.get('error') or 'Unknown error'
                         logger.error(f"Query failed: {error}")
                         raise Exception(f"Query failed: {error}")
 
-                    elif status == 'processing':
-                        logger.info(f"Status: {status}")
+                    elif event["status"] == 'cancelled':
+                        logger.warning("Query cancelled")
+                        raise Exception("Query cancelled")
 
-                    # Wait before polling again
-                    await asyncio.sleep(poll_interval)
+            raise Exception("Query stream ended without a result")
 
-            except httpx.HTTPStatusError as e:
-                logger.error(f"HTTP error during async query: {e.response.status_code} - {e.response.text}")
-                raise
-            except Exception as e:
-                logger.error(f"Error during async query: {e}")
-                raise
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error during streamed query: {e.response.status_code} - {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Error during streamed query: {e}")
+            raise
 
     async def close_session(self) -> bool:
         """Close the current session"""
         if not self.session_id:
             return False
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.delete(f"{self.base_url}/sessions/{self.session_id}")
-                response.raise_for_status()
+        try:
+            response = await self._client.delete(f"/sessions/{self.session_id}")
+            response.raise_for_status()
 
-                logger.info(f"Session {self.session_id} closed")
+            logger.info(f"Session {self.session_id} closed")
+            self.session_id = None
+            return True
+
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                logger.warning("Session not found (may have already expired)")
                 self.session_id = None
                 return True
-
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    logger.warning("Session not found (may have already expired)")
-                    self.session_id = None
-                    return True
-                logger.error(f"Error closing session: {e.response.status_code} - {e.response.text}")
-                raise
-            except Exception as e:
-                logger.error(f"Error closing session: {e}")
-                raise
+            logger.error(f"Error closing session: {e.response.status_code} - {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Error closing session: {e}")
+            raise
 
     async def list_sessions(self) -> Dict[str, Any]:
         """List all active sessions (for monitoring)"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.get(f"{self.base_url}/sessions")
-                response.raise_for_status()
-                return response.json()
+        try:
+            response = await self._client.get("/sessions")
+            response.raise_for_status()
+            return orjson.loads(response.content)
 
-            except Exception as e:
-                logger.error(f"Error listing sessions: {e}")
-                raise
+        except Exception as e:
+            logger.error(f"Error listing sessions: {e}")
+            raise
 
     async def __aenter__(self):
         """Async context manager entry"""
@@ -164,6 +250,7 @@ class WebAgentClient:
                 await self.close_session()
             except Exception as e:
                 logger.error(f"Error closing session in context manager: {e}")
+        await self._client.aclose()
 
 
 async def main():
@@ -179,12 +266,11 @@ async def main():
             print(f"Session created: {session_id}")
             print(f"Initial page: {session_info.get('page_url')}")
 
-            print("\n=== Using Async Query ===")
+            print("\n=== Using Streamed Query ===")
             try:
-                answer = await client.query_async(
+                answer = await client.query_stream(
                     question="What's the weather in Paris?",
-                    max_steps=40,
-                    poll_interval=3  # Poll every 3 seconds
+                    max_steps=40
                 )
                 print(f"Answer: {answer}")
 
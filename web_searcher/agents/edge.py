@@ -1,5 +1,3 @@
-import re
-
 from langgraph.graph import END
 from langchain_core.messages import SystemMessage
 from web_searcher.models.schemas import AgentState
@@ -18,11 +16,9 @@ def update_scratchpad(state: AgentState):
     old = state.get("scratchpad")
     if old:
         txt = old[0].content
-        last_line = txt.rsplit("\n", 1)[-1]
-        step = int(re.match(r"\d+", last_line).group()) + 1
     else:
         txt = "Previous action observations:\n"
-        step = 1
+    step = state.get("step", 0) + 1
 
     txt += f"\n{step}. {state['observation']}"
-    return {**state, "scratchpad": [SystemMessage(content=txt)]}
+    return {"step": step, "scratchpad": [SystemMessage(content=txt)]}
@@ -1,25 +1,50 @@
+import functools
 import os
 
 from langgraph.graph import START, StateGraph
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts.image import ImagePromptTemplate
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_openai import ChatOpenAI
 from langchain import hub
 
 from web_searcher.agents.edge import select_tool, update_scratchpad
-from web_searcher.agents.nodes import parse, format_descriptions, annotate
+from web_searcher.agents.nodes import parse, format_descriptions, annotate, SCREENSHOT_MIME_TYPE
 from web_searcher.agents.tools import click, type_text, scroll, wait, go_back, to_search_engine
 from web_searcher.models.schemas import AgentState
 
 
-def create_agent_graph():
+def _set_image_mime_type(prompt, mime_type: str):
+    # The hub prompt hardcodes "data:image/png;base64,{img}"; relabel it to match our screenshots
+    for message in prompt.messages:
+        parts = getattr(message, "prompt", None)
+        if not isinstance(parts, list):
+            continue
+        for part in parts:
+            if isinstance(part, ImagePromptTemplate) and isinstance(part.template.get("url"), str):
+                part.template["url"] = part.template["url"].replace("data:image/png", f"data:{mime_type}")
+    return prompt
+
+
+@functools.lru_cache(maxsize=1)
+def _build_prompt_and_llm():
     # Load prompt from hub
-    prompt = hub.pull("wfh/web-voyager")
-    llm = ChatOpenAI(model=os.getenv("OPENAI_MODEL"), max_tokens=os.getenv("OPENAI_MAX_TOKENS"))
+    prompt = _set_image_mime_type(hub.pull("wfh/web-voyager"), SCREENSHOT_MIME_TYPE)
+    max_tokens = os.getenv("OPENAI_MAX_TOKENS")
+    llm = ChatOpenAI(
+        model=os.getenv("OPENAI_MODEL"),
+        max_tokens=int(max_tokens) if max_tokens else None,
+    )
+    return prompt, llm
 
+
+def create_agent_graph():
+    prompt, llm = _build_prompt_and_llm()
+
+    # The prompt needs the whole state, but the graph only needs the new keys back
     agent = annotate | RunnablePassthrough.assign(
         prediction=format_descriptions | prompt | llm | StrOutputParser() | parse
-    )
+    ).pick(["img", "bboxes", "prediction"])
 
     graph_builder = StateGraph(AgentState)
     graph_builder.add_node("agent", agent)
@@ -1,7 +1,9 @@
+import asyncio
 import base64
 import os
+import weakref
 
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import retry, stop_after_attempt, wait_random_exponential
 from langchain_core.runnables import chain as chain_decorator
 
 
@@ -11,17 +13,37 @@ JS_PATH = os.path.normpath(os.path.join(CURRENT_DIR, '..', 'static', 'js', 'mark
 with open(JS_PATH) as f:
     MARK_PAGE_SCRIPT = f.read()
 
+# Screenshots are sent to the LLM as JPEG data URLs (see graph.py)
+SCREENSHOT_MIME_TYPE = "image/jpeg"
 
-@retry(stop=stop_after_attempt(10), wait=wait_fixed(3))
+# In-flight unmarkPage() calls, awaited before the page is marked again
+_pending_unmarks = weakref.WeakKeyDictionary()
+
+
+@retry(stop=stop_after_attempt(10), wait=wait_random_exponential(multiplier=0.5, max=10))
 async def try_mark_page(page):
     return await page.evaluate("markPage()")
 
+async def _unmark_page(page):
+    try:
+        await page.evaluate("unmarkPage()")
+    except Exception:
+        # The page may have navigated away; markPage() clears stale labels anyway
+        pass
+
+async def wait_for_unmark(page):
+    """Wait for the page's in-flight unmarkPage() call, if any"""
+    pending_unmark = _pending_unmarks.pop(page, None)
+    if pending_unmark:
+        await pending_unmark
+
 @chain_decorator
 async def mark_page(page):
-    await page.evaluate(MARK_PAGE_SCRIPT)
+    await wait_for_unmark(page)
     bboxes = await try_mark_page(page)
-    screenshot = await page.screenshot()
-    await page.evaluate("unmarkPage()")
+    screenshot = await page.screenshot(type="jpeg", quality=70, full_page=False)
+    # Remove the labels in the background while the LLM call runs
+    _pending_unmarks[page] = asyncio.create_task(_unmark_page(page))
     return {
         "img": base64.b64encode(screenshot).decode(),
         "bboxes": bboxes,
@@ -34,23 +56,20 @@ async def annotate(state):
 
 
 def format_descriptions(state):
-    labels = []
-    for i, bbox in enumerate(state["bboxes"]):
-        text = bbox.get("ariaLabel") or ""
-        if not text.strip():
-            text = bbox["text"]
-        el_type = bbox.get("type")
-        labels.append(f'{i} (<{el_type}/>): "{text}"')
-    bbox_descriptions = "\nValid Bounding Boxes:\n" + "\n".join(labels)
+    labels = "\n".join(
+        f'{i} (<{bbox.get("type")}/>): "{(bbox.get("ariaLabel") or "").strip() or bbox["text"]}"'
+        for i, bbox in enumerate(state["bboxes"])
+    )
+    bbox_descriptions = "\nValid Bounding Boxes:\n" + labels
     return {**state, "bbox_descriptions": bbox_descriptions}
 
 
 def parse(text: str) -> dict:
     action_prefix = "Action: "
-    if not text.strip().split("\n")[-1].startswith(action_prefix):
+    action_block = text.strip().rsplit("\n", 1)[-1]
+    if not action_block.startswith(action_prefix):
         return {"action": "retry", "args": f"Could not parse LLM Output: {text}"}
 
-    action_block = text.strip().split("\n")[-1]
     action_str = action_block[len(action_prefix):]
     split_output = action_str.split(" ", 1)
 
@@ -1,9 +1,13 @@
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from playwright.async_api import async_playwright
 
+from web_searcher.agents.graph import create_agent_graph
 from web_searcher.session import SessionManager
 
+logger = logging.getLogger(__name__)
+
 session_manager = SessionManager()
 
 
@@ -15,13 +19,16 @@ async def lifespan(app: FastAPI):
     playwright = await async_playwright().start()
     browser = await playwright.chromium.launch(headless=False)
 
+    # The compiled graph is stateless, so one instance serves every session
+    graph = create_agent_graph()
+
     # Initialize session manager
-    await session_manager.initialize(browser)
+    await session_manager.initialize(browser, graph)
 
     yield
 
     # Shutdown
-    print("[INFO] Shutting down - closing all sessions...")
+    logger.info("Shutting down - closing all sessions...")
     await session_manager.close_all_sessions()
 
     if browser:
@@ -1,7 +1,21 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import asyncio
+import logging
+import math
+import time
+from typing import Optional
 
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import orjson
+
+from web_searcher.agents.nodes import wait_for_unmark
 from web_searcher.api.lifespan import session_manager
-from web_searcher.models.schemas import SessionResponse, QueryResponse, QueryRequest
+from web_searcher.models.schemas import SessionResponse, QueryResponse, QueryRequest, MAX_STEPS_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Graph supersteps per agent step: agent -> tool -> update_scratchpad
+SUPERSTEPS_PER_STEP = 3
 
 router = APIRouter()
 
@@ -28,72 +42,122 @@ async def close_session(session_id: str):
 
 
 @router.get("/sessions/{session_id}", response_model=SessionResponse)
-async def get_session(session_id: str):
+async def get_session(session_id: str, response: Response):
     """Get session information"""
     session = session_manager.get_session(session_id)
 
+    # Hint pollers to come back roughly when the next step should be done,
+    # once at least one step has been timed
+    if session.status == "processing" and session.step_latency is not None:
+        retry_after = max(1, math.ceil(session.step_latency))
+        response.headers["Retry-After"] = str(retry_after)
+
     return SessionResponse(
         session_id=session.session_id,
         status=session.status,
         page_url=session.page.url if session.page else None,
         current_query=session.current_query,
         result=session.result,
-        error=session.error
+        error=session.error,
+        current_step=session.current_step,
+        current_action=session.current_action
     )
 
 
-@router.post("/sessions/{session_id}/query", response_model=QueryResponse)
-async def query_agent(session_id: str, request: QueryRequest, background_tasks: BackgroundTasks):
-    """Execute a query using the web agent"""
-    session = session_manager.get_session(session_id)
-
-    # Set session status to processing
+def _start_query(session, request: QueryRequest):
+    """Reset the session's query state before running a new query"""
     session.status = "processing"
     session.current_query = request.question
     session.result = None
     session.error = None
-
-    async def process_query():
-        try:
-            event_stream = session.graph.astream(
-                {
-                    "page": session.page,
-                    "input": request.question,
-                    "scratchpad": [],
-                },
-                {"recursion_limit": request.max_steps},
-            )
-
-            final_answer = None
-            step_count = 0
-
-            async for event in event_stream:
-                if "agent" not in event:
-                    continue
-
-                step_count += 1
-                pred = event["agent"].get("prediction") or {}
-                action = pred.get("action")
-                action_input = pred.get("args")
-
-                # Update session with current step info
-                session.current_step = step_count
-                session.current_action = f"{action}: {action_input}"
-
-                if "ANSWER" in action:
-                    final_answer = action_input[0] if action_input else None
-                    break
-
-                if step_count > request.max_steps:
-                    raise Exception(f"Max steps ({request.max_steps}) exceeded")
-
+    session.current_step = None
+    session.current_action = None
+    session.step_latency = None
+
+
+async def _run_query(session, request: QueryRequest, cancel_event: Optional[asyncio.Event] = None):
+    """Run the agent graph, updating the session and yielding one event per step"""
+    try:
+        event_stream = session.graph.astream(
+            {
+                "page": session.page,
+                "input": request.question,
+                "scratchpad": [],
+            },
+            # max_steps may change mid-run (WebSocket control), so the graph gets
+            # headroom for the hard limit and max_steps is enforced per step below
+            {"recursion_limit": SUPERSTEPS_PER_STEP * (MAX_STEPS_LIMIT + 1)},
+        )
+
+        final_answer = None
+        cancelled = False
+        step_count = 0
+        step_started = time.monotonic()
+
+        async for event in event_stream:
+            # Nothing polls the session during streamed queries, so keep it alive here
+            session.update_last_accessed()
+
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+
+            if "agent" not in event:
+                continue
+
+            step_count += 1
+            now = time.monotonic()
+            session.record_step_latency(now - step_started)
+            step_started = now
+            pred = event["agent"].get("prediction") or {}
+            action = pred.get("action")
+            action_input = pred.get("args")
+
+            # Update session with current step info
+            session.current_step = step_count
+            session.current_action = f"{action}: {action_input}"
+            yield {"step": step_count, "action": session.current_action}
+
+            if "ANSWER" in action:
+                final_answer = action_input[0] if action_input else None
+                break
+
+            if step_count >= request.max_steps:
+                raise Exception(f"Max steps ({request.max_steps}) exceeded")
+
+        if cancelled:
+            session.status = "cancelled"
+            logger.info(f"Query cancelled in session {session.session_id}")
+        else:
             session.status = "completed"
             session.result = final_answer
 
-        except Exception as e:
+    except Exception as e:
+        session.status = "error"
+        session.error = str(e)
+        logger.exception(f"Query error in session {session.session_id}: {e}")
+
+    finally:
+        # The last step's unmark is otherwise left running past the end of the query
+        await wait_for_unmark(session.page)
+
+        # The consumer went away mid-query (e.g. the stream client disconnected)
+        if session.status == "processing":
             session.status = "error"
-            session.error = str(e)
-            print(f" [ERROR] Query error in session {session_id}: {e}")
+            session.error = "Query interrupted"
+
+    yield {"status": session.status, "answer": session.result, "error": session.error}
+
+
+@router.post("/sessions/{session_id}/query", response_model=QueryResponse)
+async def query_agent(session_id: str, request: QueryRequest, background_tasks: BackgroundTasks):
+    """Execute a query using the web agent"""
+    session = session_manager.get_session(session_id)
+    _start_query(session, request)
+
+    async def process_query():
+        async for _ in _run_query(session, request):
+            pass
 
     background_tasks.add_task(process_query)
 
@@ -104,6 +168,68 @@ async def query_agent(session_id: str, request: QueryRequest, background_tasks:
     )
 
 
+@router.post("/sessions/{session_id}/query/stream")
+async def query_agent_stream(session_id: str, request: QueryRequest):
+    """Execute a query and stream its progress as Server-Sent Events"""
+    session = session_manager.get_session(session_id)
+    _start_query(session, request)
+
+    async def event_gen():
+        async for event in _run_query(session, request):
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+
+    return StreamingResponse(event_gen(), media_type="text/event-stream")
+
+
+@router.websocket("/sessions/{session_id}/query/ws")
+async def query_agent_ws(websocket: WebSocket, session_id: str):
+    """Execute a query over a WebSocket, accepting control messages while it runs"""
+    await websocket.accept()
+
+    try:
+        session = session_manager.get_session(session_id)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+
+    # The first message carries the query itself
+    try:
+        request = QueryRequest(**await websocket.receive_json())
+    except (TypeError, ValueError) as e:
+        await websocket.close(code=1003, reason=f"Invalid query: {e}")
+        return
+    except WebSocketDisconnect:
+        return
+
+    _start_query(session, request)
+    cancel_event = asyncio.Event()
+
+    async def receive_control():
+        try:
+            while True:
+                try:
+                    message = await websocket.receive_json()
+                    if message.get("type") == "cancel":
+                        cancel_event.set()
+                    elif message.get("type") == "max_steps":
+                        request.max_steps = min(max(int(message["value"]), 1), MAX_STEPS_LIMIT)
+                except (AttributeError, KeyError, TypeError, ValueError) as e:
+                    # A malformed message must not stop us from hearing a later cancel
+                    logger.warning(f"Ignoring invalid control message in session {session_id}: {e}")
+        except WebSocketDisconnect:
+            cancel_event.set()
+
+    control_task = asyncio.create_task(receive_control())
+    try:
+        async for event in _run_query(session, request, cancel_event):
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        cancel_event.set()
+    finally:
+        control_task.cancel()
+
+
 # Additional monitoring endpoints
 @router.get("/sessions")
 async def list_sessions():
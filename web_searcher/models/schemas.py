@@ -26,16 +26,20 @@ class AgentState(TypedDict):
     prediction: Prediction
     scratchpad: List[BaseMessage]
     observation: str
+    step: int
+
+
+MAX_STEPS_LIMIT = 500
 
 
 class QueryRequest(BaseModel):
     question: str = Field(..., description="The question to ask the web agent")
-    max_steps: int = Field(default=150, description="Maximum number of steps to execute")
+    max_steps: int = Field(default=150, ge=1, le=MAX_STEPS_LIMIT, description="Maximum number of steps to execute")
 
 
 class QueryResponse(BaseModel):
     session_id: str
-    status: Literal["processing", "completed", "error"]
+    status: Literal["processing", "completed", "error", "cancelled"]
     answer: Optional[str] = None
     error: Optional[str] = None
     current_step: Optional[int] = None
@@ -44,8 +48,10 @@ class QueryResponse(BaseModel):
 
 class SessionResponse(BaseModel):
     session_id: str
-    status: Literal["active", "processing", "completed", "error"]
+    status: Literal["active", "processing", "completed", "error", "cancelled"]
     page_url: Optional[str] = None
     current_query: Optional[str] = None
     result: Optional[str] = None
     error: Optional[str] = None
+    current_step: Optional[int] = None
+    current_action: Optional[str] = None
@@ -4,10 +4,9 @@ from typing import Dict, Any, Optional
 from uuid import uuid4
 from fastapi import HTTPException
 import logging
-from threading import RLock
 from datetime import datetime, timedelta
 
-from web_searcher.agents.graph import create_agent_graph
+from web_searcher.agents.nodes import MARK_PAGE_SCRIPT
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,14 +17,16 @@ logger = logging.getLogger(__name__)
 class SessionInfo:
     """Structured session information"""
     session_id: str
+    context: Any  # Playwright BrowserContext owning the page
     page: Any  # Playwright Page object
-    graph: Any  # LangGraph object
+    graph: Any  # Compiled LangGraph object, shared across sessions
     status: str = "active"
     current_query: Optional[str] = None
     result: Optional[str] = None
     error: Optional[str] = None
     current_step: Optional[int] = None
     current_action: Optional[str] = None
+    step_latency: Optional[float] = None  # EWMA of seconds per agent step
     created_at: datetime = field(default_factory=datetime.now)
     last_accessed: datetime = field(default_factory=datetime.now)
     timeout_minutes: int = 30  # Default session timeout
@@ -34,24 +35,35 @@ class SessionInfo:
         """Update last accessed timestamp"""
         self.last_accessed = datetime.now()
 
+    def record_step_latency(self, seconds: float, alpha: float = 0.3):
+        """Fold a new step duration into the moving average"""
+        if self.step_latency is None:
+            self.step_latency = seconds
+        else:
+            self.step_latency = alpha * seconds + (1 - alpha) * self.step_latency
+
     def is_expired(self) -> bool:
         """Check if the session has expired"""
         return datetime.now() - self.last_accessed > timedelta(minutes=self.timeout_minutes)
 
 
 class SessionManager:
-    """Thread-safe session manager with automatic cleanup"""
+    """Async-safe session manager with automatic cleanup"""
 
     def __init__(self, cleanup_interval: int = 300):  # 5 minutes
         self._sessions: Dict[str, SessionInfo] = {}
-        self._lock = RLock()
+        # Sessions found expired on access, closed by the cleanup task
+        self._pending_cleanup: Dict[str, SessionInfo] = {}
+        self._lock = asyncio.Lock()
         self._cleanup_interval = cleanup_interval
         self._cleanup_task: Optional[asyncio.Task] = None
         self._browser = None
+        self._graph = None
 
-    async def initialize(self, browser):
-        """Initialize the session manager with browser instance"""
+    async def initialize(self, browser, graph):
+        """Initialize the session manager with browser instance and compiled agent graph"""
         self._browser = browser
+        self._graph = graph
         # Start cleanup task
         self._cleanup_task = asyncio.create_task(self._cleanup_expired_sessions())
 
@@ -61,19 +73,25 @@ class SessionManager:
             raise RuntimeError("Browser not initialized")
 
         session_id = str(uuid4())
+        context = None
 
         try:
-            page = await self._browser.new_page()
+            # Own the context explicitly so teardown closes it (new_page() would create one implicitly)
+            context = await self._browser.new_context()
+            page = await context.new_page()
+            # Install the marking helpers once; every navigation re-runs them
+            await page.add_init_script(MARK_PAGE_SCRIPT)
             await page.goto("https://www.duckduckgo.com")
 
             session = SessionInfo(
                 session_id=session_id,
+                context=context,
                 page=page,
-                graph=create_agent_graph(),
+                graph=self._graph,
                 timeout_minutes=timeout_minutes
             )
 
-            with self._lock:
+            async with self._lock:
                 self._sessions[session_id] = session
 
             logger.info(f"Created session {session_id}")
@@ -81,46 +99,51 @@ class SessionManager:
 
         except Exception as e:
             logger.error(f"Failed to create session: {e}")
+            if context:
+                await context.close()
             raise HTTPException(status_code=500, detail=f"Failed to create session: {e}")
 
     def get_session(self, session_id: str) -> SessionInfo:
         """Get session by ID and update last accessed time"""
-        with self._lock:
-            if session_id not in self._sessions:
-                raise HTTPException(status_code=404, detail="Session not found")
+        # No await in here, so the event loop cannot interleave another task
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
 
-            session = self._sessions[session_id]
+        # Check if the session is expired
+        if session.is_expired():
+            # Hand it over to the cleanup task instead of closing it here
+            self._pending_cleanup[session_id] = self._sessions.pop(session_id)
+            raise HTTPException(status_code=404, detail="Session expired")
 
-            # Check if the session is expired
-            if session.is_expired():
-                # Clean up expired session
-                asyncio.create_task(self._cleanup_session(session_id))
-                raise HTTPException(status_code=404, detail="Session expired")
-
-            session.update_last_accessed()
-            return session
+        session.update_last_accessed()
+        return session
 
     async def close_session(self, session_id: str) -> bool:
         """Close a specific session"""
-        with self._lock:
+        async with self._lock:
             if session_id not in self._sessions:
                 return False
 
             session = self._sessions[session_id]
 
-        # Close page outside lock to avoid blocking
-        try:
-            if session.page:
-                await session.page.close()
-        except Exception as e:
-            logger.warning(f"Error closing page for session {session_id}: {e}")
+        # Close context (and its page) outside lock to avoid blocking
+        await self._close_context(session)
 
-        with self._lock:
-            del self._sessions[session_id]
+        async with self._lock:
+            self._sessions.pop(session_id, None)
 
         logger.info(f"Closed session {session_id}")
         return True
 
+    async def _close_context(self, session: SessionInfo):
+        """Internal method to close a session's browser context (and its page)"""
+        try:
+            if session.context:
+                await session.context.close()
+        except Exception as e:
+            logger.warning(f"Error closing context for session {session.session_id}: {e}")
+
     async def _cleanup_session(self, session_id: str):
         """Internal method to clean up a single session"""
         try:
@@ -135,11 +158,20 @@ class SessionManager:
                 await asyncio.sleep(self._cleanup_interval)
 
                 expired_sessions = []
-                with self._lock:
+                async with self._lock:
                     for session_id, session in self._sessions.items():
-                        if session.is_expired():
+                        # Never pull the browser out from under a running query
+                        if session.status != "processing" and session.is_expired():
                             expired_sessions.append(session_id)
 
+                    pending_sessions = list(self._pending_cleanup.values())
+                    self._pending_cleanup.clear()
+
+                # Close sessions already dropped by get_session
+                for session in pending_sessions:
+                    logger.info(f"Cleaning up expired session {session.session_id}")
+                    await self._close_context(session)
+
                 # Clean up expired sessions
                 for session_id in expired_sessions:
                     logger.info(f"Cleaning up expired session {session_id}")
@@ -150,11 +182,20 @@ class SessionManager:
 
     async def close_all_sessions(self):
         """Close all sessions (for shutdown)"""
-        session_ids = list(self._sessions.keys())
+        async with self._lock:
+            sessions = list(self._sessions.values()) + list(self._pending_cleanup.values())
+            self._sessions.clear()
+            self._pending_cleanup.clear()
+
+        # Close contexts concurrently, but without stampeding the browser
+        sem = asyncio.Semaphore(20)
+
+        async def _close(session: SessionInfo):
+            async with sem:
+                await self._close_context(session)
 
-        # Close all sessions concurrently
-        tasks = [self.close_session(session_id) for session_id in session_ids]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*[_close(session) for session in sessions])
+        logger.info(f"Closed {len(sessions)} sessions")
 
         # Cancel cleanup task
         if self._cleanup_task:
@@ -166,19 +207,17 @@ class SessionManager:
 
     def get_session_count(self) -> int:
         """Get the current number of active sessions"""
-        with self._lock:
-            return len(self._sessions)
+        return len(self._sessions)
 
     def get_session_info(self) -> Dict[str, Dict[str, Any]]:
         """Get info about all sessions (for debugging/monitoring)"""
-        with self._lock:
-            return {
-                session_id: {
-                    "status": session.status,
-                    "created_at": session.created_at.isoformat(),
-                    "last_accessed": session.last_accessed.isoformat(),
-                    "current_query": session.current_query,
-                    "page_url": session.page.url if session.page else None
-                }
-                for session_id, session in self._sessions.items()
+        return {
+            session_id: {
+                "status": session.status,
+                "created_at": session.created_at.isoformat(),
+                "last_accessed": session.last_accessed.isoformat(),
+                "current_query": session.current_query,
+                "page_url": session.page.url if session.page else None
             }
+            for session_id, session in self._sessions.items()
+        }
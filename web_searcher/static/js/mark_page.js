@@ -16,7 +16,12 @@ const customCSS = `
 
 const styleTag = document.createElement("style");
 styleTag.textContent = customCSS;
-document.head.append(styleTag);
+// Installed as an init script, so <head> may not exist yet
+if (document.head) {
+  document.head.append(styleTag);
+} else {
+  document.addEventListener("DOMContentLoaded", () => document.head.append(styleTag));
+}
 
 let labels = [];
 